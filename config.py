@@ -1,24 +1,53 @@
+import os
+from dataclasses import dataclass
+from functools import lru_cache
+from types import MappingProxyType
+
+# Settings for one OMIE endpoint.
+# ttl is how long its responses stay in the cache (None uses cache_ttl below),
+# page_size is the registros_por_pagina sent with every page.
+@dataclass(frozen=True, slots=True)
+class Endpoint:
+    url: str
+    ttl: int | None = None
+    page_size: int = 50
+
 # You can find the API endpoints in the OMIE API documentation: https://developer.omie.com.br/api/
-# If there is a new endpoint, you can add it to the calltype dictionary below.
+# If there is a new endpoint, you can add it to the ENDPOINTS dictionary below (path relative to _base_url).
+# Volatile data can get a short cache time, e.g. Endpoint(_base_url + "financas/contareceber/", ttl=60)
 # API endpoints configuration
-calltype = {
-    "ListarContasReceber": "https://app.omie.com.br/api/v1/financas/contareceber/",
-    "ListarContasPagar": "https://app.omie.com.br/api/v1/financas/contapagar/",
-    "ListarDepatartamentos": "https://app.omie.com.br/api/v1/geral/departamentos/",    
-    "ListarProjetos": "https://app.omie.com.br/api/v1/geral/projetos/",
-    "ListarClientes": "https://app.omie.com.br/api/v1/geral/clientes/",
-    "ListarCategorias": "https://app.omie.com.br/api/v1/geral/categorias/",
-    "ListarContasCorrentes": "https://app.omie.com.br/api/v1/geral/contacorrente/",
-    }
-
-# If you want to use your own credentials, you can add them to a .env file and use the os.getenv() function to get them. 
-# For ease of use, you can just uncomment the following lines and add your credentials to the .env file.
-"""
-import os
-from dotenv import load_dotenv
+_base_url = "https://app.omie.com.br/api/v1/"
+ENDPOINTS = MappingProxyType({
+    "ListarContasReceber": Endpoint(_base_url + "financas/contareceber/"),
+    "ListarContasPagar": Endpoint(_base_url + "financas/contapagar/"),
+    "ListarDepartamentos": Endpoint(_base_url + "geral/departamentos/"),
+    "ListarProjetos": Endpoint(_base_url + "geral/projetos/"),
+    "ListarClientes": Endpoint(_base_url + "geral/clientes/"),
+    "ListarCategorias": Endpoint(_base_url + "geral/categorias/"),
+    "ListarContasCorrentes": Endpoint(_base_url + "geral/contacorrente/"),
+    })
+
+# Plain name -> URL view, kept for code that only needs the address
+calltype = MappingProxyType({name: endpoint.url for name, endpoint in ENDPOINTS.items()})
+
+# Format of the response file. "json" saves one JSON array with every page,
+# "ndjson" saves one page per line so the file can be read back page by page.
+output_format = "json"
+
+# Compress the response file while it is written. Use None, "gzip" or "zstd" (needs the zstandard package).
+# Paginated exports are very repetitive JSON, so this cuts the file size a lot on slow disks.
+output_compression = None
+
+# Keep API responses in the .omie_cache folder and reuse them for this many seconds (e.g. 3600).
+# Repeating a query then skips the network entirely. 0 disables the cache.
+# Each Endpoint's ttl overrides this for that call.
+cache_ttl = 0
 
-load_dotenv() 
+# If you want to use your own credentials, you can add them to a .env file (APP_KEY and APP_SECRET).
+# They are read the first time they are needed, so importing this file stays cheap.
+@lru_cache(maxsize=1)
+def credentials():
+    from dotenv import load_dotenv
 
-app_key = os.getenv("APP_KEY")
-app_secret = os.getenv("APP_SECRET")
-"""
\ No newline at end of file
+    load_dotenv()
+    return os.getenv("APP_KEY"), os.getenv("APP_SECRET")
@@ -1,138 +1,482 @@
-import requests
 import os
+import re
+import sys
+import io
+import itertools
+import hashlib
 import json
 import time
-from dotenv import load_dotenv
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 import config
 
-# Start the timer
-start_time = time.time()
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
-load_dotenv() 
+# Without orjson, ujson is still a drop-in speedup over the stdlib module
+try:
+    import ujson as json_mod
+except ImportError:
+    json_mod = json
+
+# Big write buffer so streamed pages reach the disk in a few large writes
+OUTPUT_BUFFER_SIZE = 1024 * 1024
+
+# File suffix added for each value of config.output_compression
+COMPRESSION_EXTENSIONS = {None: "", "gzip": ".gz", "zstd": ".zst"}
+
+# Pages fetched in parallel. The connection pool is sized to match so no worker waits for a socket.
+MAX_WORKERS = 8
+
+# (connect, read) timeout in seconds for each API request
+REQUEST_TIMEOUT = (5, 30)
+
+# Credential lines written by update_config_credentials
+CREDENTIAL_LINE = re.compile(r'^app_(key|secret) = ".*"$')
+
+# Name the credentials are stored under when the keyring package is available
+KEYRING_SERVICE = "omie_api"
+
+# Raw API responses are kept here when config.cache_ttl is set
+CACHE_DIR = ".omie_cache"
+
+def write_config_credentials(app_key=None, app_secret=None):
+    # Rewrite the config module get_credentials reads, wherever the script is run from
+    path = config.__file__
+    tmp_path = path + ".tmp"
+
+    # Replace any saved credentials instead of appending another copy every time
+    with open(path, encoding='utf-8') as f:
+        lines = [line for line in f.read().splitlines() if not CREDENTIAL_LINE.match(line)]
+    content = "\n".join(lines).rstrip("\n") + "\n"
+    if app_key is not None:
+        content += f'\napp_key = "{app_key}"\napp_secret = "{app_secret}"\n'
+
+    # Write a temporary file and swap it in so config.py is never left half written
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+
+def load_keyring_credentials():
+    try:
+        import keyring
+        app_key = keyring.get_password(KEYRING_SERVICE, "app_key")
+        app_secret = keyring.get_password(KEYRING_SERVICE, "app_secret")
+    except Exception:
+        # keyring not installed or no usable backend (e.g. headless Linux)
+        return None
+    if not app_key or not app_secret:
+        return None
+    return app_key, app_secret
+
+def save_keyring_credentials(app_key, app_secret):
+    # Key and secret are stored as separate entries so neither needs escaping
+    try:
+        import keyring
+        keyring.set_password(KEYRING_SERVICE, "app_key", app_key)
+        keyring.set_password(KEYRING_SERVICE, "app_secret", app_secret)
+    except Exception:
+        return False
+    return True
 
 def update_config_credentials():
     input_key = input("Please enter your app_key: ")
     input_secret = input("Please enter your app_secret: ")
-    
-    # Update the config file with new credentials
-    with open('config.py', 'a') as f:
-        f.write(f'\napp_key = "{input_key}"\n')
-        f.write(f'app_secret = "{input_secret}"\n')
+
+    # Prefer the OS keyring so the secret is not kept as plain text in config.py
+    if save_keyring_credentials(input_key, input_secret):
+        if hasattr(config, "app_key"):
+            write_config_credentials()
+    else:
+        write_config_credentials(input_key, input_secret)
     return input_key, input_secret
 
 def get_credentials():
-    try:
-        app_key = config.app_key
-        app_secret = config.app_secret
-        
-        change = input("Credentials already exist. Would you like to change them? (y/n): ")
-        if change.lower() == 'y':
-            return update_config_credentials()
-        return app_key, app_secret
-    except AttributeError:
+    credentials = load_keyring_credentials()
+    if credentials is None:
+        try:
+            credentials = (config.app_key, config.app_secret)
+        except AttributeError:
+            credentials = config.credentials()
+    if not all(credentials):
         print("No credentials found. Please enter your credentials.")
         return update_config_credentials()
 
+    change = input("Credentials already exist. Would you like to change them? (y/n): ")
+    if change.lower() == 'y':
+        return update_config_credentials()
+    return credentials
+
 def select_call_type():
+    call_names = list(config.ENDPOINTS)
     print("Please select the call you want to make:")
-    for i, call_name in enumerate(config.calltype.keys(), 1):
+    for i, call_name in enumerate(call_names, 1):
         print(f"{i}. {call_name}")
     
     while True:
         try:
             selection = int(input("Enter the number of your selection: "))
-            if 1 <= selection <= len(config.calltype):
-                return list(config.calltype.keys())[selection-1]
+            if 1 <= selection <= len(call_names):
+                return call_names[selection-1]
             else:
                 print("Invalid selection. Please enter a valid number.")
         except ValueError:
             print("Please enter a valid number.")
 
-def api_omie(call, page=1, credentials=None):
-    if credentials is None:
-        app_key, app_secret = get_credentials()
-    else:
-        app_key, app_secret = credentials
+def create_session():
+    # requests is slow to import, so it is only loaded once the prompts are answered
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+
+    # One session per run so every page reuses the same TCP/TLS connection
+    session = requests.Session()
+    # Ask for compressed bodies explicitly, requests decompresses them for us
+    session.headers.update({
+        "Content-Type": "application/json",
+        "Accept-Encoding": "gzip, deflate",
+        "Connection": "keep-alive",
+    })
+    # Every endpoint lives on app.omie.com.br, so one pool serves all of them.
+    # The Listar calls only read data, so retrying the POST on throttling or gateway errors is safe.
+    retry = Retry(
+        total=3,
+        backoff_factor=0.3,
+        status_forcelist=[429, 502, 503, 504],
+        allowed_methods=frozenset(["POST"]),
+        raise_on_status=False,
+    )
+    session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=MAX_WORKERS, max_retries=retry))
+    return session
 
-    API_URL = config.calltype.get(call)
-    if not API_URL:
+def get_endpoint(call):
+    endpoint = config.ENDPOINTS.get(call)
+    if endpoint is None:
         raise ValueError(f"Invalid call type: {call}")
+    return endpoint
 
-    print("--------------------------------")
-    print(f"Call: {call}")
-    print(f"URL: {API_URL}")
-    print(f"Page: {page}")
-    print("--------------------------------")
+def get_api_url(call):
+    return get_endpoint(call).url
 
+@lru_cache(maxsize=256)
+def build_payload_template(call, credentials):
+    # Encode the request body once, only the page number changes between pages.
+    # Cached so repeated runs of the same call (or api_omie without a template) reuse the bytes.
+    app_key, app_secret = credentials
     data = {
         "call": call,
         "app_key": app_key,
         "app_secret": app_secret,
         "param": [
             {
-                "pagina": page,
-                "registros_por_pagina": 50
+                "pagina": 0,
+                "registros_por_pagina": get_endpoint(call).page_size
             }
         ]
     }
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, separators=(",", ":")).encode("utf-8")
 
-    headers = {"Content-Type": "application/json"}
-    response = requests.post(API_URL, json=data, headers=headers)
-    
-    if response.status_code != 200:
-        print(f"Error: {response.status_code}")
+def api_omie(call, page=1, credentials=None, session=None, url=None, template=None):
+    if template is None:
+        if credentials is None:
+            credentials = get_credentials()
+        template = build_payload_template(call, tuple(credentials))
+
+    if session is None:
+        # One-off call: use a session just for this request and close it afterwards
+        with create_session() as session:
+            return api_omie(call, page, credentials, session, url, template)
+
+    API_URL = url or get_api_url(call)
+
+    # Strings inside the template are JSON-escaped, so this can only hit the real field
+    body = template.replace(b'"pagina":0', b'"pagina":%d' % page, 1)
+
+    # The body holds the call, credentials and page, so it identifies the request on its own
+    cache_ttl = get_cache_ttl(call)
+    cached = None
+    content = None
+    if cache_ttl:
+        cache_key = hashlib.blake2b(API_URL.encode("utf-8") + body, digest_size=16).hexdigest()
+        cached = read_cache(call, cache_key)
+        if cached is not None and cached[1] <= cache_ttl:
+            content = cached[0]
+
+    if content is None:
+        # An expired entry can still be revalidated: a 304 means it is unchanged and we skip the download
+        headers = None
+        if cached is not None and cached[2]:
+            headers = {"If-None-Match": cached[2]}
+        response = session.post(API_URL, data=body, headers=headers, timeout=REQUEST_TIMEOUT)
+
+        if response.status_code == 304 and cached is not None:
+            content = cached[0]
+            touch_cache(call, cache_key)
+        elif response.status_code != 200:
+            print(f"Error: {response.status_code}")
+            return None
+        else:
+            content = response.content
+            if cache_ttl:
+                write_cache(call, cache_key, content, response.headers.get("ETag"))
+
+    # Parse the raw bytes directly, skipping requests' charset detection
+    if orjson is not None:
+        return orjson.loads(content)
+    return json_mod.loads(content)
+
+def get_cache_ttl(call):
+    ttl = get_endpoint(call).ttl
+    if ttl is None:
+        return getattr(config, "cache_ttl", 0)
+    return ttl
+
+def cache_path(call, key):
+    # One folder per call so a single endpoint can be cleared on its own
+    return os.path.join(CACHE_DIR, call, key + ".json")
+
+def read_cache(call, key):
+    # Returns (content, age in seconds, etag) or None when nothing is cached
+    path = cache_path(call, key)
+    try:
+        age = time.time() - os.path.getmtime(path)
+        with open(path, "rb") as f:
+            content = f.read()
+    except OSError:
         return None
+    try:
+        with open(path + ".etag", encoding="utf-8") as f:
+            etag = f.read()
+    except OSError:
+        etag = None
+    return content, age, etag
+
+def write_file_atomic(path, data):
+    # Write next to the target and rename so a crash never leaves half a file behind
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+def write_cache(call, key, content, etag=None):
+    path = cache_path(call, key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    write_file_atomic(path, content)
+    if etag:
+        write_file_atomic(path + ".etag", etag.encode("utf-8"))
+    elif os.path.exists(path + ".etag"):
+        os.remove(path + ".etag")
+
+def touch_cache(call, key):
+    # Restart the TTL of an entry the server confirmed is still current
+    os.utime(cache_path(call, key))
 
-    return response.json()
+def clear_cache(call=None):
+    path = CACHE_DIR if call is None else os.path.join(CACHE_DIR, call)
+    if os.path.isdir(path):
+        import shutil
+        shutil.rmtree(path)
+
+def ask_clear_cache(call):
+    if get_cache_ttl(call) and os.path.isdir(os.path.join(CACHE_DIR, call)):
+        clear = input(f"Cached responses found for {call}. Would you like to clear them? (y/n): ")
+        if clear.lower() == 'y':
+            clear_cache(call)
+
+def fetch_all(call, credentials, session, max_workers=MAX_WORKERS):
+    url = get_api_url(call)
+    template = build_payload_template(call, tuple(credentials))
+
+    print("--------------------------------")
+    print(f"Call: {call}")
+    print(f"URL: {url}")
+    print("--------------------------------")
+
+    # Page 1 tells us how many pages exist, the rest are independent
+    first = api_omie(call, 1, credentials, session, url, template)
+    if not first:
+        return
+    yield first
+
+    total_pages = first.get('total_de_paginas', 0)
+    del first
+    if total_pages <= 1:
+        return
+
+    # The pool keeps later pages downloading while the caller writes out earlier ones.
+    # max_workers also caps in-flight requests so we don't hit OMIE's rate limit.
+    # Only a small window of pages is submitted ahead, so fetching waits when writing falls behind
+    # and each page is dropped as soon as it has been handed over.
+    pages = iter(range(2, total_pages + 1))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        window = deque()
+
+        def top_up():
+            for page in itertools.islice(pages, 2 * max_workers - len(window)):
+                window.append((page, executor.submit(api_omie, call, page, credentials, session, url, template)))
+
+        # Hand the pages back in order. A failed page aborts the export so save_pages
+        # throws away the file instead of keeping a silently truncated one.
+        try:
+            top_up()
+            while window:
+                page, future = window.popleft()
+                result = future.result()
+                del future
+                if not result:
+                    raise RuntimeError(f"Page {page} of {total_pages} failed, response not saved")
+                top_up()
+                # Rewrite one progress line instead of printing a line per page
+                sys.stdout.write(f"\rFetched page {page} of {total_pages}")
+                sys.stdout.flush()
+                yield result
+                del result
+        finally:
+            sys.stdout.write("\n")
+            for _, future in window:
+                future.cancel()
+
+class PagesEncoder(json.JSONEncoder):
+    # Encodes any iterable of pages as a JSON array without building a list first
+    def iterencode(self, o, _one_shot=False):
+        yield "[\n"
+        first = True
+        for page in o:
+            if not first:
+                yield ",\n"
+            yield from super().iterencode(page)
+            first = False
+        yield "\n]\n"
+
+def output_extension():
+    output_format = getattr(config, "output_format", "json")
+    if output_format not in ("json", "ndjson"):
+        raise ValueError(f"Invalid output format: {output_format}")
+    compression = getattr(config, "output_compression", None)
+    if compression not in COMPRESSION_EXTENSIONS:
+        raise ValueError(f"Invalid output compression: {compression}")
+    return "." + output_format + COMPRESSION_EXTENSIONS[compression]
+
+def open_output(output_file):
+    compression = getattr(config, "output_compression", None)
+    if compression == "gzip":
+        import gzip
+        f = gzip.open(output_file, "wb", compresslevel=6)
+    elif compression == "zstd":
+        import zstandard
+        # stream_writer compresses each write as it comes, no need to hold the whole file
+        f = zstandard.ZstdCompressor(level=3).stream_writer(open(output_file, "wb", buffering=OUTPUT_BUFFER_SIZE))
+    else:
+        f = open(output_file, "wb", buffering=OUTPUT_BUFFER_SIZE)
+
+    if orjson is not None:
+        return f
+    return io.TextIOWrapper(f, encoding="utf-8")
+
+def write_page(f, page):
+    if orjson is not None:
+        f.write(orjson.dumps(page, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS))
+        f.write(b"\n")
+    else:
+        json_mod.dump(page, f, indent=4, ensure_ascii=False)
+        f.write("\n")
+
+def write_pages(f, pages):
+    if orjson is not None:
+        # orjson is much faster on big payloads and already returns UTF-8 bytes
+        f.write(b"[\n")
+        for i, page in enumerate(pages):
+            if i:
+                f.write(b",\n")
+            f.write(orjson.dumps(page, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS))
+        f.write(b"\n]\n")
+    elif json_mod is not json:
+        f.write("[\n")
+        for i, page in enumerate(pages):
+            if i:
+                f.write(",\n")
+            json_mod.dump(page, f, indent=4, ensure_ascii=False)
+        f.write("\n]\n")
+    else:
+        # Stream the stdlib encoder's chunks straight into the buffer
+        for chunk in PagesEncoder(indent=4, ensure_ascii=False).iterencode(pages):
+            f.write(chunk)
+
+def write_ndjson(f, pages):
+    # One compact page per line, nothing has to be kept between pages
+    for page in pages:
+        if orjson is not None:
+            f.write(orjson.dumps(page, option=orjson.OPT_NON_STR_KEYS) + b"\n")
+        else:
+            f.write(json_mod.dumps(page, ensure_ascii=False) + "\n")
+
+def save_pages(pages, base_name="response"):
+    # Pages are written as they arrive instead of being collected first.
+    # The file is only created once the first page is in.
+    pages = iter(pages)
+    first = next(pages, None)
+    if first is None:
+        return None
+
+    # Write under a temporary name so a failed run never leaves half a file behind
+    output_file = get_unique_filename(base_name, output_extension())
+    tmp_file = f"{output_file}.{os.getpid()}.tmp"
+    try:
+        with open_output(tmp_file) as f:
+            if getattr(config, "output_format", "json") == "ndjson":
+                write_ndjson(f, itertools.chain([first], pages))
+            elif first.get('total_de_paginas', 1) <= 1:
+                # Single page responses are saved as-is, without a list around them
+                write_page(f, first)
+            else:
+                write_pages(f, itertools.chain([first], pages))
+    except BaseException:
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+        raise
+    os.replace(tmp_file, output_file)
+    return output_file
 
 def get_unique_filename(base_name, extension=".json"):
+    # List the directory once instead of calling os.path.exists for every candidate
+    directory = os.path.dirname(base_name) or "."
+    prefix = os.path.basename(base_name)
+    with os.scandir(directory) as entries:
+        existing = {e.name for e in entries if e.name.startswith(prefix) and e.name.endswith(extension)}
+
     counter = 1
-    new_filename = f"{base_name}{extension}"
-    while os.path.exists(new_filename):
-        new_filename = f"{base_name}_{counter}{extension}"
+    new_filename = f"{prefix}{extension}"
+    while new_filename in existing:
+        new_filename = f"{prefix}_{counter}{extension}"
         counter += 1
-    return new_filename
+    return os.path.join(os.path.dirname(base_name), new_filename)
 
 if __name__ == "__main__":
+    # Start the timer
+    start_time = time.perf_counter()
+
     try:
         # Get credentials once at the start
         credentials = get_credentials()
         
         # Select call type once at the start
         selected_call = select_call_type()
+
+        ask_clear_cache(selected_call)
         
-        all_results = []
-        current_page = 1
-        
-        while True:
-            result = api_omie(call=selected_call, page=current_page, credentials=credentials)
-            if not result:
-                break
+        with create_session() as session:
+            output_file = save_pages(fetch_all(selected_call, credentials, session))
 
-            all_results.append(result)
-            
-            # Get total pages from response
-            total_pages = result.get('total_de_paginas', 0)
-            
-            if current_page >= total_pages:
-                break
-                
-            current_page += 1
-            print(f"Fetching page {current_page} of {total_pages}")
-            
-        if all_results:
-            # Combine all results into one JSON
-            combined_result = json.dumps(all_results, indent=4, ensure_ascii=False)
-            #print(combined_result)
-            
-            # Save combined response to file with unique name
-            output_file = get_unique_filename("response")
-            with open(output_file, "w", encoding="utf-8") as f:
-                f.write(combined_result)
+        if output_file:
             print(f"Response saved to {output_file}")
             
         # End the timer and calculate execution time
-        end_time = time.time()
+        end_time = time.perf_counter()
         execution_time = end_time - start_time
         print(f"Execution completed in {execution_time:.2f} seconds")
     